@@ -1,5 +1,4 @@
 import argparse
-import json
 import matplotlib.pyplot as plt
 import os
 from typing import List, Tuple, Set
@@ -97,15 +96,16 @@ def __collect_issues_summary(project: str, save=True) -> List[
     if not os.path.isdir(directory):
         print("The folder does not exist. Make sure you fetched and parsed at least one issue.")
         return []
-    issues_dir = os.listdir(directory)
+    issues_dir = utils.list_json_files(directory)
     issues = []
+    if save:
+        utils.create_dir_if_necessary(os.path.join("Projects", project, "Summary"))
 
     for filename in issues_dir:
         path = os.path.join(directory, filename)
-        with open(path, 'r') as issue_file:
-            issue = json.load(issue_file)
-            summary = __collect_issue_summary(project, issue, save)
-            issues.append(summary)
+        issue = utils.load_json(path)
+        summary = __collect_issue_summary(project, issue, save)
+        issues.append(summary)
     return issues
 
 
@@ -120,9 +120,6 @@ def __save_references(project: str,
     :return: None
     """
     summary_dir = os.path.join("Projects", project, "Summary")
-    if not os.path.isdir(summary_dir):
-        os.mkdir(summary_dir)
-
     issue_dict = {
         "issue_key": issue_summary[0],
         "issue_id": issue_summary[1],
@@ -159,22 +156,21 @@ def __generate_statistics(project: str) -> List[Tuple[int, int, int, int, int, i
     issues = []
     summary_directory = os.path.join("Projects", project, "Summary")
 
-    for filename in os.listdir(summary_directory):
+    for filename in utils.list_json_files(summary_directory):
         path = os.path.join(summary_directory, filename)
-        with open(path, 'r') as file:
-            data = json.load(file)
-            issues.append(
-                (str(data["issue_key"]),
-                 int(data["issue_id"]),
-                 list(data["urls"]),
-                 list(data["revisions"]),
-                 list(data["mailing_lists"]),
-                 list(data["pdf_documents"]),
-                 list(data["archives"]),
-                 list(data["other_issues"]),
-                 data["commits"],
-                 data["pull_requests"])
-            )
+        data = utils.load_json(path)
+        issues.append(
+            (str(data["issue_key"]),
+             int(data["issue_id"]),
+             list(data["urls"]),
+             list(data["revisions"]),
+             list(data["mailing_lists"]),
+             list(data["pdf_documents"]),
+             list(data["archives"]),
+             list(data["other_issues"]),
+             data["commits"],
+             data["pull_requests"])
+        )
     issues = sorted(issues, key=lambda x: x[1])
 
     # Since the number of references in each issue can be very little, it makes sense to combine them in blocks of 100
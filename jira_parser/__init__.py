@@ -1,21 +1,52 @@
+import asyncio
+import functools
 import os
+import random
+from datetime import datetime, timedelta, timezone
 import traceback
+import aiohttp
 from jira.client import JIRA
+from requests.adapters import HTTPAdapter
 from typing import List, Tuple, Optional
 import utils
 
 from github_fetcher import GitHubFetcher
 
 APACHE_JIRA_SERVER = "https://issues.apache.org/jira/"
+MAX_CONCURRENT_REQUESTS = 32
+# Number of blocks of issues fetched at a time. Each block stays in memory until it is saved.
+MAX_CONCURRENT_BLOCKS = 4
+# Requests failing with a connection error, 429 or 5xx status are repeated up to MAX_RETRIES times, waiting
+# RETRY_BACKOFF seconds before the first retry and twice as long before each next one.
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+JQL_DATE_FORMAT = "%Y/%m/%d %H:%M"
+# Dates in JQL queries are interpreted in the time zone of the Jira server, whereas the time of the last
+# synchronization is stored in UTC, so the query is widened by this margin.
+LAST_SYNC_MARGIN = timedelta(days=1)
+
+
+@functools.lru_cache(maxsize=None)
+def get_jira_client() -> JIRA:
+    """
+    Get the Jira client shared by all parsers. Its session keeps up to MAX_CONCURRENT_REQUESTS connections to the
+    server alive, so that consecutive requests do not have to set up a new connection.
+    :return: Jira client
+    """
+    jira = JIRA(server=APACHE_JIRA_SERVER)
+    adapter = HTTPAdapter(pool_connections=MAX_CONCURRENT_REQUESTS, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+    jira._session.mount("https://", adapter)
+    return jira
 
 
 class JiraParser:
     def __init__(self, jira_project: str, github_repository: str = None, github_credentials: Tuple[str, str] = None):
-        self.jira = JIRA(server=APACHE_JIRA_SERVER)
+        self.jira = get_jira_client()
         self.project = jira_project
         self.project_dir = os.path.join("Projects", self.project)
         self.issues_raw_dir = os.path.join(self.project_dir, "Issues_raw")
         self.issues_dir = os.path.join(self.project_dir, "Issues")
+        self.last_sync_path = os.path.join(self.project_dir, ".last_sync")
         self.fields = "comment," \
                       "attachment," \
                       "issuelinks," \
@@ -32,46 +63,234 @@ class JiraParser:
             self.github = GitHubFetcher(jira_project, github_repository.replace("https://github.com/", ""),
                                         github_credentials)
 
-    def fetch_issues_raw(self, block_index: int = 0, save: bool = True) -> List[dict]:
+    def fetch_issues_raw(self) -> int:
         """
-        Fetch all issues in their raw (unparsed) form from the project
-        and return them as a list of dictionaries (decoded JSON form). Each issue will additionally have a key
-        "remotelinks" which stores a list of remote links found in the issue (remote links cannot be fetched alongside
-        other fields).
-        :param block_index: Issues are fetched in blocks of 100 issues each, so this variable shows which block should
-        the program start with
-        :param save: Whether to persist issues in JSON format
-        :return: List of issues as dictionaries
+        Fetch all issues in their raw (unparsed) form from the project and persist them in JSON format. Each issue
+        will additionally have a key "remotelinks" which stores a list of remote links found in the issue (remote links
+        cannot be fetched alongside other fields).
+        Blocks of issues and their remote links are requested concurrently, at most MAX_CONCURRENT_REQUESTS requests
+        and MAX_CONCURRENT_BLOCKS blocks at a time. Every block is saved as soon as it is complete and is not kept in
+        memory afterwards; use load_issues_raw to read the fetched issues back.
+        Only issues updated since the last complete run are queried, and issues whose cached copy has the same update
+        time are neither completed with remote links nor saved again, so an interrupted run is resumed cheaply by
+        simply running it again.
+        :return: Number of fetched new or updated issues
         """
         print("{}: fetching issues. This may take a while".format(self.project))
-        issues = []
+        sync_time = datetime.now(timezone.utc)
+        query = self.__build_query()
+        utils.create_dir_if_necessary(self.issues_raw_dir)
+        count, failed_keys = asyncio.run(self.__fetch_issues_raw_async(query))
+        # Issues that could not be fetched completely are not saved. They must be queried again on the next run, so the
+        # time of this run is not recorded then.
+        if failed_keys:
+            print("{}: Failed to fetch issues {}. They will be fetched on the next run".format(self.project,
+                                                                                          ", ".join(failed_keys)))
+        else:
+            with open(self.last_sync_path, "w") as file:
+                file.write(sync_time.strftime(JQL_DATE_FORMAT))
+        print("{}: Finished fetching and saving issues! Totally fetched: {}".format(self.project, count))
+        return count
+
+    def __build_query(self) -> str:
+        """
+        Build the JQL query for the issues of the project. If the project was completely fetched before, only issues
+        updated since then are queried.
+        :return: JQL query
+        """
+        query = "project={}".format(self.project)
+        if os.path.isfile(self.last_sync_path) and os.path.isdir(self.issues_raw_dir):
+            with open(self.last_sync_path, "r") as file:
+                last_sync = datetime.strptime(file.read().strip(), JQL_DATE_FORMAT)
+            query += " AND updated >= \"{}\"".format((last_sync - LAST_SYNC_MARGIN).strftime(JQL_DATE_FORMAT))
+        return query + " ORDER BY key ASC"
+
+    async def __fetch_issues_raw_async(self, query: str) -> Tuple[int, List[str]]:
+        """
+        Fetch the first block of issues to find out the total number of issues in the project, then fetch and save the
+        remaining blocks, at most MAX_CONCURRENT_BLOCKS at a time. A single session is shared by all requests, so that
+        connections are reused.
+        :param query: JQL query selecting issues to fetch
+        :return: Tuple containing the number of fetched issues and the list of keys of issues that failed to be fetched
+        """
         block_size = 100
+        connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+            block_semaphore = asyncio.Semaphore(MAX_CONCURRENT_BLOCKS)
+            total, count, failed_keys = await self.__fetch_and_save_block_raw(session, semaphore, block_semaphore,
+                                                                              query, 0, block_size)
+            blocks = await asyncio.gather(*[
+                self.__fetch_and_save_block_raw(session, semaphore, block_semaphore, query, index, block_size)
+                for index in range(block_size, total, block_size)
+            ])
+        for _, block_count, block_failed_keys in blocks:
+            count += block_count
+            failed_keys.extend(block_failed_keys)
+        return count, failed_keys
+
+    async def __fetch_and_save_block_raw(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                                         block_semaphore: asyncio.Semaphore, query: str, start_index: int,
+                                         block_size: int) -> Tuple[int, int, List[str]]:
+        """
+        Fetch a single block of issues and save it. The block semaphore is held until the block is saved, so that only
+        a limited number of blocks is kept in memory at a time.
+        :param session: Session to send requests with
+        :param semaphore: Semaphore limiting the number of simultaneous requests
+        :param block_semaphore: Semaphore limiting the number of blocks being fetched simultaneously
+        :param query: JQL query selecting issues to fetch
+        :param start_index: Index of the first issue in the block
+        :param block_size: Maximal number of issues in the block
+        :return: Tuple containing three values:
+        1. Total number of issues matching the query
+        2. Number of saved issues
+        3. List of keys of issues that failed to be fetched
+        """
+        async with block_semaphore:
+            total, fetched_issues, failed_keys = await self.__fetch_block_raw(session, semaphore, query, start_index,
+                                                                              block_size)
+            self.__save_issues_raw(fetched_issues)
+        print("{}: Fetched issues {}-{}".format(self.project, start_index + 1, min(start_index + block_size, total)))
+        return total, len(fetched_issues), failed_keys
+
+    async def __fetch_block_raw(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, query: str,
+                                start_index: int, block_size: int) -> Tuple[int, List[dict], List[str]]:
+        """
+        Fetch a single block of issues together with remote links of each issue in the block. Issues that have not
+        changed since they were cached are left out, as well as issues whose remote links or comments failed to be
+        fetched.
+        :param session: Session to send requests with
+        :param semaphore: Semaphore limiting the number of simultaneous requests
+        :param query: JQL query selecting issues to fetch
+        :param start_index: Index of the first issue in the block
+        :param block_size: Maximal number of issues in the block
+        :return: Tuple containing three values:
+        1. Total number of issues matching the query
+        2. List of new or updated issues
+        3. List of keys of issues that failed to be fetched
+        """
+        params = {
+            "jql": query,
+            "startAt": str(start_index),
+            "maxResults": str(block_size),
+            "validateQuery": "true",
+            "fields": self.fields
+        }
+        block = await self.__get_json(session, semaphore, APACHE_JIRA_SERVER + "rest/api/2/search", params)
+        issues = [issue for issue in block["issues"] if not self.__is_cached(issue)]
+        completed = await asyncio.gather(*[self.__complete_issue_raw(session, semaphore, issue) for issue in issues])
+        fetched_issues = [issue for issue, is_completed in zip(issues, completed) if is_completed]
+        failed_keys = [issue["key"] for issue, is_completed in zip(issues, completed) if not is_completed]
+        return block["total"], fetched_issues, failed_keys
+
+    async def __complete_issue_raw(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                                   issue: dict) -> bool:
+        """
+        Add remote links to the issue and, if the search returned only a part of its comments, the remaining comments.
+        An incomplete issue must not be saved: its cached copy would be considered up to date by the next run.
+        :param session: Session to send requests with
+        :param semaphore: Semaphore limiting the number of simultaneous requests
+        :param issue: Raw issue to complete
+        :return: Whether the issue was completed successfully
+        """
+        try:
+            await self.__fetch_remote_links_raw(session, semaphore, issue)
+            # Comments come inline with the issue, but Jira caps their number. Only issues exceeding the cap are
+            # completed with separate requests.
+            if self.__has_truncated_comments(issue):
+                await self.__fetch_comments_raw(session, semaphore, issue)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            print("An error occurred while trying to retrieve remote links or comments for issue {}".format(
+                issue["key"]))
+            traceback.print_exc()
+            return False
+        return True
+
+    def __is_cached(self, issue: dict) -> bool:
+        """
+        Check whether the raw issue is already saved completely and with the same update time. A copy saved by
+        fetch_issue_raw may lack remote links or a part of the comments, in which case it is fetched again.
+        :param issue: Raw issue as returned by the search
+        :return: True if the saved copy is up to date
+        """
+        cached_issue = self.load_issue_raw(issue["key"])
+        return cached_issue is not None and \
+            cached_issue["fields"]["updated"] == issue["fields"]["updated"] and \
+            "remotelinks" in cached_issue and \
+            not self.__has_truncated_comments(cached_issue)
+
+    @staticmethod
+    def __has_truncated_comments(issue: dict) -> bool:
+        """
+        Check whether the search endpoint returned only a part of the issue's comments.
+        :param issue: Raw issue
+        :return: True if some comments are missing
+        """
+        comment = issue["fields"]["comment"]
+        return comment["total"] > len(comment["comments"])
+
+    async def __fetch_comments_raw(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                                   issue: dict) -> None:
+        """
+        Fetch all comments of the issue page by page and replace the inline comments with them.
+        :param session: Session to send requests with
+        :param semaphore: Semaphore limiting the number of simultaneous requests
+        :param issue: Raw issue to fetch comments for
+        :return: None
+        """
+        url = APACHE_JIRA_SERVER + "rest/api/2/issue/{}/comment".format(issue["key"])
+        comments = []
         while True:
-            start_index = block_index * block_size
-            fetched_issues = [issue.raw for issue in self.jira.search_issues("project={}".format(self.project),
-                                                                             startAt=start_index,
-                                                                             maxResults=block_size,
-                                                                             validate_query=True,
-                                                                             fields=self.fields)]
-            if len(fetched_issues) == 0:
+            page = await self.__get_json(session, semaphore, url, {"startAt": str(len(comments))})
+            comments.extend(page["comments"])
+            if not page["comments"] or len(comments) >= page["total"]:
                 break
-            block_index += 1
-            for issue in fetched_issues:
-                issue["remotelinks"] = []
-                try:
-                    remote_links = self.jira.remote_links(issue["key"])
-                    issue["remotelinks"] = [link.raw for link in remote_links]
-                except:
-                    print("An error occurred while trying to retrieve remote links for issue {}".format(issue["key"]))
-                    traceback.print_exc()
-            issues.extend(fetched_issues)
-            print("{}: Fetched {} issues".format(self.project, len(issues)))
-            if save:
-                self.__save_issues_raw(fetched_issues)
-        print("{}: Finished fetching {} issues! Totally fetched: {}".format(self.project,
-                                                                            " and saving" if save else "",
-                                                                            len(issues)))
-        return issues
+        comment = issue["fields"]["comment"]
+        comment["comments"] = comments
+        comment["maxResults"] = comment["total"] = len(comments)
+
+    async def __fetch_remote_links_raw(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                                       issue: dict) -> None:
+        """
+        Fetch remote links of the issue and store them under the key "remotelinks".
+        :param session: Session to send requests with
+        :param semaphore: Semaphore limiting the number of simultaneous requests
+        :param issue: Raw issue to fetch remote links for
+        :return: None
+        """
+        url = APACHE_JIRA_SERVER + "rest/api/2/issue/{}/remotelink".format(issue["key"])
+        issue["remotelinks"] = await self.__get_json(session, semaphore, url)
+
+    @staticmethod
+    async def __get_json(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, url: str,
+                         params: dict = None) -> object:
+        """
+        Send a GET request and return the decoded JSON response. Like the Jira client does, requests failing with
+        a connection error, 429 or 5xx status are retried up to MAX_RETRIES times with exponential backoff. If the server
+        specifies how long to wait with the "Retry-After" header, it is respected instead.
+        :param session: Session to send the request with
+        :param semaphore: Semaphore limiting the number of simultaneous requests
+        :param url: URL to request
+        :param params: Query parameters
+        :return: Decoded JSON response
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            retry_after = None
+            try:
+                async with semaphore:
+                    async with session.get(url, params=params) as response:
+                        if attempt == MAX_RETRIES or response.status != 429 and response.status < 500:
+                            response.raise_for_status()
+                            return await response.json()
+                        retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES:
+                    raise
+            if retry_after and retry_after.isdecimal():
+                delay = float(retry_after)
+            else:
+                delay = RETRY_BACKOFF * 2 ** attempt + random.uniform(0, RETRY_BACKOFF)
+            await asyncio.sleep(delay)
 
     def fetch_issue_raw(self, issue_key: str, save: bool = True) -> dict:
         """
@@ -88,17 +307,17 @@ class JiraParser:
             print("An error occurred while trying to retrieve remote links for issue {}".format(issue["key"]))
             traceback.print_exc()
         if save:
+            utils.create_dir_if_necessary(self.issues_raw_dir)
             self.__save_issues_raw([issue])
         return issue
 
     def __save_issues_raw(self, issues: List[dict]) -> None:
         """
-        Persist raw issues in the corresponding folder.
+        Persist raw issues in the corresponding folder. The folder is expected to exist.
         :param issues: List of dictionaries describing unparsed issues
         :return: None
         """
         directory = self.issues_raw_dir
-        utils.create_dir_if_necessary(directory)
         print("\t{}: Successfully saved!".format(self.project))
         for issue in issues:
             key = issue["key"]
@@ -115,7 +334,7 @@ class JiraParser:
         if not os.path.exists(directory):
             return []
         issues = []
-        files = os.listdir(directory)
+        files = utils.list_json_files(directory)
         for filename in files:
             path = os.path.join(directory, filename)
             issue = utils.load_json(path)
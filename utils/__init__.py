@@ -1,29 +1,70 @@
-import errno
+import functools
 import json
 import os
+from typing import FrozenSet
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library is used as a fallback
+    orjson = None
 
 from .ref_regex import *
 from .latex_transform import *
 
+REFERENCES_CACHE_MAX_TEXT_LENGTH = 64 * 1024
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".rar", ".iso", ".gz", ".rz", ".lz", ".7z")
+DEFAULT_MAILING_LIST_KEYS = ("mail-archive", "markmail", "pipermail", "hyperkitty", "hypermail", "mailinglistarchive")
+
+
+def save_as_json(obj: object, path: str, durable: bool = False) -> None:
+    # Files are written without indentation since they are only read back by the program itself.
+    # Use save_as_pretty_json to get a human-readable file.
+    __write_json(__dumps(obj, pretty=False), path, durable)
+
+
+def save_as_pretty_json(obj: object, path: str, durable: bool = False) -> None:
+    __write_json(__dumps(obj, pretty=True), path, durable)
+
+
+def __dumps(obj: object, pretty: bool) -> bytes:
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(obj, indent=2).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
 
-def save_as_json(obj: object, path: str) -> None:
-    with open(path, "w") as file:
-        json.dump(obj, file, indent=2)
+def __write_json(content: bytes, path: str, durable: bool) -> None:
+    # Serializing to a string first lets the whole document go out in a single write, whereas json.dump issues
+    # a separate write for every token.
+    # The document is written to a temporary file that then atomically replaces the target, so an interrupted run
+    # never leaves a truncated file behind. If durable is set, the content is also flushed to the disk before that.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(content)
+        if durable:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(tmp_path, path)
 
 
 def load_json(path: str) -> dict:
-    with open(path, "r") as file:
-        loaded = json.load(file)
-    return loaded
+    with open(path, "rb") as file:
+        content = file.read()
+    return orjson.loads(content) if orjson else json.loads(content)
+
+
+def list_json_files(dir_path: str) -> List[str]:
+    """
+    List names of JSON files in the directory. Temporary files left by an interrupted save are skipped.
+    :param dir_path: Directory to list
+    :return: List of file names
+    """
+    return [filename for filename in os.listdir(dir_path) if filename.endswith(".json")]
 
 
 def create_dir_if_necessary(dir_path: str) -> None:
-    if not os.path.exists(dir_path):
-        try:
-            os.makedirs(dir_path)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise
+    os.makedirs(dir_path, exist_ok=True)
 
 
 def define_github_credentials(credentials: str) -> Tuple[str, str]:
@@ -51,6 +92,8 @@ def construct_svn_revision_url(revision: str) -> str:
 def extract_references(text: str, project: str) -> Tuple[Set[str], Set[str], Set[str], Set[str], Set[str], Set[str]]:
     """
     Extract different types of references from the specified text.
+    Identical texts (e.g. quoted comments) are common, so references extracted from texts shorter than
+    REFERENCES_CACHE_MAX_TEXT_LENGTH are cached.
     :param text: Text to extract references from
     :param project: Name of the project; helpful for some references extractors
     :return: Tuple of sets containing data in the following format:
@@ -59,6 +102,20 @@ def extract_references(text: str, project: str) -> Tuple[Set[str], Set[str], Set
         3. Mailing lists
         4. PDF documents URLs
     """
+    if text and len(text) < REFERENCES_CACHE_MAX_TEXT_LENGTH:
+        references = __extract_references_cached(text, project)
+    else:
+        references = __extract_references(text, project)
+    # Callers are free to modify the returned sets, so cached references are never handed out directly.
+    return tuple(set(reference) for reference in references)
+
+
+@functools.lru_cache(maxsize=4096)
+def __extract_references_cached(text: str, project: str) -> Tuple[FrozenSet[str], ...]:
+    return tuple(frozenset(reference) for reference in __extract_references(text, project))
+
+
+def __extract_references(text: str, project: str) -> Tuple[Set[str], Set[str], Set[str], Set[str], Set[str], Set[str]]:
     urls = extract_urls(text, project)
     revisions = extract_revisions(text)
 
@@ -83,7 +140,7 @@ def filter_pdf_document_urls(urls: Set[str]) -> Set[str]:
     :param urls: List of URLs to filter PDF documents from
     :return: List of PDF document URLS
     """
-    return set([url for url in urls if url.endswith(".pdf")])
+    return {url for url in urls if url.endswith(".pdf")}
 
 
 def filter_archives_urls(urls: Set[str]) -> Set[str]:
@@ -92,9 +149,7 @@ def filter_archives_urls(urls: Set[str]) -> Set[str]:
     :param urls:
     :return:
     """
-    return set([url for url in urls if any([url.endswith(ending)
-                                            for ending
-                                            in [".zip", ".tar", ".rar", ".iso", ".gz", ".rz", ".lz", ".7z"]])])
+    return {url for url in urls if url.endswith(ARCHIVE_EXTENSIONS)}
 
 
 def filter_mailing_list_urls(urls: Set[str], mailing_list_keys=None) -> Set[str]:
@@ -102,9 +157,12 @@ def filter_mailing_list_urls(urls: Set[str], mailing_list_keys=None) -> Set[str]
     Filter URLs leading to mailing lists. This is a very rough implementation and should definitely be improved.
     :param urls: List of URLs to filter mailing lists from
     :param mailing_list_keys: If the URL is a mailing list, any entry from this list should be present in the URL.
-    Otherwise, it checks whether the url contains "mail-archives" or "markmail".
+    Otherwise, it checks whether the url contains any of DEFAULT_MAILING_LIST_KEYS.
     :return: List of mailing list URLs
     """
     if not mailing_list_keys:
-        mailing_list_keys = ["mail-archive", "markmail", "pipermail", "hyperkitty", "hypermail", "mailinglistarchive"]
-    return set([url for url in urls if any(key in url for key in mailing_list_keys)])
+        # The default keys are checked inline, which is several times faster than iterating over them for every URL.
+        # This chain must match DEFAULT_MAILING_LIST_KEYS.
+        return {url for url in urls if "mail-archive" in url or "markmail" in url or "pipermail" in url or
+                "hyperkitty" in url or "hypermail" in url or "mailinglistarchive" in url}
+    return {url for url in urls if any(key in url for key in mailing_list_keys)}
@@ -2,6 +2,10 @@ import re
 from typing import List, Tuple
 from pylatex.utils import escape_latex, NoEscape
 
+noformat_pattern = re.compile(r"{noformat}(.*?){noformat}", re.DOTALL)
+listing_pattern = re.compile(r"(({code:(.*?)})|({code}))(.*?){code}", re.DOTALL)
+listing_language_pattern = re.compile(r"{code:(.*?)}", re.DOTALL)
+
 
 def escape_noformat(string: str, to_latex: bool = True) -> Tuple[str, List[Tuple[str, str]]]:
     """
@@ -18,23 +22,18 @@ def escape_noformat(string: str, to_latex: bool = True) -> Tuple[str, List[Tuple
         2.2 Content that is intended to replace the flag in the string
     """
     noformats = []
-    noformat_index = 1
-    pattern = re.compile(r"{noformat}((?s).*?){noformat}")
 
-    while True:
-        noformat = pattern.search(string)
-        if not noformat:
-            break
+    def replace_noformat(noformat) -> str:
         content = noformat.group(0)
-        key = "<<!PDFGENNOFORMAT{}!>>".format(noformat_index)
-        noformat_index += 1
-        string = string.replace(content, key)
-
+        key = "<<!PDFGENNOFORMAT{}!>>".format(len(noformats) + 1)
         if to_latex:
-            content = content.replace(r"{noformat}", r"\begin{spverbatim}", 1)
-            content = content.replace(r"{noformat}", r"\end{spverbatim}\ ", 1)
-
+            content = r"\begin{spverbatim}" + noformat.group(1) + r"\end{spverbatim}\ "
         noformats.append((key, content))
+        return key
+
+    # All blocks are replaced in a single pass over the string. Each block gets its own flag, even if the same block
+    # occurs several times.
+    string = noformat_pattern.sub(replace_noformat, string)
     return string, noformats
 
 
@@ -53,22 +52,15 @@ def escape_listings(string: str, to_latex: bool = True) -> Tuple[str, List[Tuple
         2.2 Content that is intended to replace the flag in the string
     """
     listings = []
-    listing_index = 1
-    pattern = re.compile(r"(({code:((?s).*?)})|({code}))((?s).*?){code}")
-    # This regex is written with intent to capture the programming language of the code block.
+    # The listing regex is written with intent to capture the programming language of the code block.
     # The code block starts with either {code:language} or with just {code}.
     # Since each code block ends with {code}, we first have to extract all code blocks that start with a language
     # defined, and only then - blocks without a language, otherwise, we can accidentally extract a text between the end
     # of one block and the start of another block.
 
-    while True:
-        listing = pattern.search(string)
-        if not listing:
-            break
+    def replace_listing(listing) -> str:
         content = listing.group(0)
-        key = "<<!PDFGENCODE{}!>>".format(listing_index)
-        listing_index += 1
-        string = string.replace(content, key)
+        key = "<<!PDFGENCODE{}!>>".format(len(listings) + 1)
         if to_latex:
             # If this value is true, then all code blocks starting with:
             #   {code:lang} are replaced by "\begin{lstlisting}[language=lang]"
@@ -76,7 +68,7 @@ def escape_listings(string: str, to_latex: bool = True) -> Tuple[str, List[Tuple
             # All endings are replaced by "\end{lstlisting}\ ". That extra whitespace is intentional, since in the
             # original text, there is a newline character, and PyLaTeX escapes it with a "\newline" command.
             # It is forbidden to include it after environments which are not fit right into the text.
-            language = re.search(r"{code:((?s).*?)}", content)
+            language = listing_language_pattern.search(content)
 
             if language:
                 section = language.group(0)
@@ -100,6 +92,11 @@ def escape_listings(string: str, to_latex: bool = True) -> Tuple[str, List[Tuple
                     content = '\n'.join(line[i:i + 400] for i in range(0, len(line), 400))
             '\n'.join(lines)
         listings.append((key, content))
+        return key
+
+    # All blocks are replaced in a single pass over the string. Each block gets its own flag, even if the same block
+    # occurs several times.
+    string = listing_pattern.sub(replace_listing, string)
     return string, listings
 
 
@@ -1,23 +1,47 @@
+import functools
 import re
 
-from typing import List, Set
+from typing import List, Pattern, Set
 
 # Regex developed by Diego Perini: https://gist.github.com/dperini/729294
 # Was converted from JS to Python using https://regex101.com/
-URL_REGEX = r"(?:(?:(?:https?|ftp):)?\/\/)(?:\S+(?::\S*)?@)?(?:(?!(?:10|127)" \
+# The user info part "\S+(?::\S*)?@" of the original regex is replaced by "[^\s/?#@]+@". The original is meant to
+# validate a whole string; when searching a text, it runs to the end of the word after every "//", which is quadratic
+# on long words such as pasted logs, and it could swallow the path of one URL together with the start of the next one.
+URL_REGEX = r"(?:(?:(?:https?|ftp):)?\/\/)(?:[^\s/?#@]+@)?(?:(?!(?:10|127)" \
             r"(?:\.\d{1,3}){3})(?!(?:169\.254|192\.168)(?:\.\d{1,3}){2})(?!172\." \
             r"(?:1[6-9]|2\d|3[0-1])(?:\.\d{1,3}){2})(?:[1-9]\d?|1\d\d|2[01]\d|22[0-3])" \
             r"(?:\.(?:1?\d{1,2}|2[0-4]\d|25[0-5])){2}(?:\.(?:[1-9]\d?|1\d\d|2[0-4]\d|25[0-4]))" \
             r"|(?:(?:[a-z0-9\u00a1-\uffff][a-z0-9\u00a1-\uffff_-]{0,62})?[a-z0-9\u00a1-\uffff]\.)" \
             r"+(?:[a-z\u00a1-\uffff]{2,}\.?))(?::\d{2,5})?(?:[/?#]\S*)?"
-SVN_REVISION_REGEX = r"(?:r|[Rr]ev. |[Rr]evision |[Cc]ommit )([0-9]+)"
+SVN_REVISION_PREFIX_REGEX = r"(?:r|[Rr]ev. |[Rr]evision |[Cc]ommit )"
+SVN_REVISION_REGEX = SVN_REVISION_PREFIX_REGEX + r"([0-9]+)"
 GIT_COMMIT_REGEX = r"[0-9a-f]{40}"  # This regex does not always work correctly, so it is decided to ditch it for now.
-NUMBER_REGEX = r"d+"
+# Both kinds of revisions are found in a single scan: the first group holds an SVN revision, the second - a Git commit.
+# Since matches cannot overlap, an SVN revision is not matched where a Git commit starts (e.g. "commit 3f2a..."),
+# otherwise the leading digits of the commit would be taken for an SVN revision and the commit itself would be lost.
+REVISION_REGEX = r"{0}(?!{1})([0-9]+)|({1})".format(SVN_REVISION_PREFIX_REGEX, GIT_COMMIT_REGEX)
+NUMBER_REGEX = r"\d+"
+
+URL_TRAILING_CHARS = frozenset(['.', '\\', '?', ',', ':', '/'])
+CLEAR_TEXT_TABLE = str.maketrans({char: ' ' for char in ['[', ']', '<', '>', '\\', "\""]})
 
 url_matcher = re.compile(URL_REGEX)
 svn_revision_matcher = re.compile(SVN_REVISION_REGEX)
 git_commit_matcher = re.compile(GIT_COMMIT_REGEX)
 number_matcher = re.compile(NUMBER_REGEX)
+revision_matcher = re.compile(REVISION_REGEX)
+
+
+@functools.lru_cache(maxsize=32)
+def issue_matcher(project_name: str) -> Pattern:
+    """
+    Compile the regex matching issue IDs of the project. Compiled regexes are cached, so that each project's regex
+    is only built once.
+    :param project_name: Name of the project to match issue IDs
+    :return: Compiled regex
+    """
+    return re.compile("{}-{}".format(re.escape(project_name), r'\d+'))
 
 
 def extract_urls(text: str, project: str, filter_svn_revisions=True, filter_issues=True) -> Set[str]:
@@ -32,43 +56,25 @@ def extract_urls(text: str, project: str, filter_svn_revisions=True, filter_issu
     if not text:
         return set()
     text = clear_text(text)
-    # Some characters still remain in the URL after extraction, although they are not expected to be there, so we
-    # remove them beforehand.
-    urls = set(url_matcher.findall(text))
-    urls = set(
-        filter(
-            lambda url: url.startswith("http"),  # It has been observed that some extracted URLs do not start with http.
-            urls
-        )
-    )
-    urls = set(
-        map(
-            # if a URL ends with '.', '\' or '?', then we should remove that character
-            lambda url: url[:-1] if url[-1] in ['.', '\\', '?', ',', ':', '/'] else url,
-            urls
-        )
-    )
-    urls = set(
-        map(
-            # if a URL ends with ')' and there is no opening bracket '(' in it
-            lambda url: url[:-1] if url[-1] == ')' and '(' not in url else url,
-            urls
-        )
-    )
-    if filter_svn_revisions:
-        urls = set(
-            filter(
-                lambda url: not url.startswith("https://svn.apache.org"),
-                urls
-            )
-        )
-    if filter_issues:
-        urls = set(
-            filter(
-                lambda url: not extract_issues(url, project),
-                urls
-            )
-        )
+    project_issue_matcher = issue_matcher(project) if filter_issues else None
+    urls = set()
+    for match in url_matcher.finditer(text):
+        url = match.group(0)
+        # It has been observed that some extracted URLs do not start with http.
+        if not url.startswith("http"):
+            continue
+        # Some characters still remain in the URL after extraction, although they are not expected to be there, so we
+        # remove them. If a URL ends with '.', '\' or '?', then we should remove that character
+        if url[-1] in URL_TRAILING_CHARS:
+            url = url[:-1]
+        # if a URL ends with ')' and there is no opening bracket '(' in it
+        if url[-1] == ')' and '(' not in url:
+            url = url[:-1]
+        if filter_svn_revisions and url.startswith("https://svn.apache.org"):
+            continue
+        if filter_issues and project_issue_matcher.search(url):
+            continue
+        urls.add(url)
     return urls
 
 
@@ -81,8 +87,7 @@ def extract_issues(text: str, project_name: str) -> Set[str]:
     """
     if not text:
         return set()
-    issue_matcher = re.compile("{}-{}".format(project_name, r'\d+'))
-    return set(issue_matcher.findall(text))
+    return {match.group(0) for match in issue_matcher(project_name).finditer(text)}
 
 
 def extract_revisions(text: str) -> Set[str]:
@@ -93,7 +98,7 @@ def extract_revisions(text: str) -> Set[str]:
     """
     if not text:
         return set()
-    return set(svn_revision_matcher.findall(text) + git_commit_matcher.findall(text))
+    return {match.group(1) or match.group(2) for match in revision_matcher.finditer(text)}
 
 
 def extract_numbers(text: str) -> List[int]:
@@ -104,12 +109,7 @@ def extract_numbers(text: str) -> List[int]:
     """
     if not text:
         return []
-    return list(
-        map(
-            lambda number: int(number),
-            re.findall(r'\d+', text)
-        )
-    )
+    return [int(match.group(0)) for match in number_matcher.finditer(text)]
 
 
 def clear_text(text: str) -> str:
@@ -127,7 +127,6 @@ def clear_text(text: str) -> str:
     """
     if not text:
         return ""
-    chars_to_remove = [r'\n', '[', ']', '<', '>', '\\', "\""]
-    for char in chars_to_remove:
-        text = text.replace(char, ' ')
-    return text
+    # The escaped newline consists of two characters, so it has to be replaced before translating single characters,
+    # otherwise only its backslash would be replaced.
+    return text.replace(r'\n', ' ').translate(CLEAR_TEXT_TABLE)